@@ -13,7 +13,18 @@ from langchain_core.memory import BaseMemory
 from langchain_core.messages import HumanMessage, AIMessage
 from langchain.chains import create_history_aware_retriever, create_retrieval_chain
 from langchain.chains.combine_documents import create_stuff_documents_chain
-from .config import GOOGLE_API_KEY, PERSIST_DIRECTORY, DEFAULT_EMBEDDING_MODEL, DEFAULT_LLM_MODEL
+from .config import GOOGLE_API_KEY, PERSIST_DIRECTORY, DEFAULT_EMBEDDING_MODEL, DEFAULT_LLM_MODEL, CHUNK_SIZE, CHUNK_OVERLAP, RETRIEVER_SEARCH_TYPE, RETRIEVER_K, RETRIEVER_FETCH_K
+
+def build_retriever(vector_store, search_type: str = RETRIEVER_SEARCH_TYPE, k: int = RETRIEVER_K, fetch_k: int = RETRIEVER_FETCH_K):
+    """
+    Builds a retriever over the vector store with the given search settings.
+    fetch_k, the number of candidates MMR re-ranks, is only passed on for "mmr" search.
+    Returns an instance of the retriever class
+    """
+    search_kwargs = {"k": k}
+    if search_type == "mmr":
+        search_kwargs["fetch_k"] = fetch_k
+    return vector_store.as_retriever(search_type = search_type, search_kwargs = search_kwargs)
 
 class Indexing:
     """
@@ -21,14 +32,15 @@ class Indexing:
     and storing them in a Chroma vector database using Google Generative AI embeddings. It builds a 
     retriever for efficient semantic search over the indexed document chunks.
     """
-    def __init__(self, urls: list, persist_dir: str, embeddingmodel: str, api_key: str, chunk_size: int = 2000, chunk_overlap: int = 400): # Added type hints
+    def __init__(self, urls: list, persist_dir: str, embeddingmodel: str, api_key: str, chunk_size: int = CHUNK_SIZE, chunk_overlap: int = CHUNK_OVERLAP, embedding_model_instance: Any = None): # Added type hints
         self.urls = urls
         self.persist_dir = persist_dir
         self.embeddingmodel = embeddingmodel
         self.api_key = api_key
         self.chunk_size = chunk_size
         self.chunk_overlap = chunk_overlap
-        self.embedding_model_instance = GoogleGenerativeAIEmbeddings(model=self.embeddingmodel, google_api_key=self.api_key)
+        # An embeddings instance can be passed in to share it (e.g. a cache-backed one) between indexes
+        self.embedding_model_instance = embedding_model_instance or GoogleGenerativeAIEmbeddings(model=self.embeddingmodel, google_api_key=self.api_key)
         self.vector_store = Chroma(persist_directory=self.persist_dir, embedding_function=self.embedding_model_instance)
 
 
@@ -109,10 +121,7 @@ class Indexing:
 
         self.embed_and_store(splits) 
         
-        retriever = self.vector_store.as_retriever( 
-            search_type = "mmr",
-            search_kwargs = {"k":10}
-        )
+        retriever = build_retriever(self.vector_store)
         print(f"[{__name__}] Indexing complete. Retriever ready.")
         return retriever
 
@@ -131,7 +140,7 @@ class Generation:
             api_key (str): Google API key for the LLM.
             retriever (Any): The LangChain retriever instance (from ChromaDB).
             model (str): The LLM model to use.
-            memory (BaseMemory): A pre-configured LangChain memory object (e.g., ConversationBufferWindowMemory).
+            memory (BaseMemory): A pre-configured LangChain memory object (e.g., SummaryBufferMemory).
         """
         self.query = query
         self.api_key = api_key
@@ -12,6 +12,21 @@ SECRET_KEY = os.getenv("SECRET_KEY")
 ALGORITHM = os.getenv("ALGORITHM") 
 DEFAULT_EMBEDDING_MODEL = "models/embedding-001"
 DEFAULT_LLM_MODEL = "gemini-2.5-flash"
+CHUNK_SIZE = int(os.getenv("CHUNK_SIZE", "2000"))
+CHUNK_OVERLAP = int(os.getenv("CHUNK_OVERLAP", "400"))
+RETRIEVER_SEARCH_TYPE = os.getenv("RETRIEVER_SEARCH_TYPE", "mmr")
+RETRIEVER_K = int(os.getenv("RETRIEVER_K", "10"))
+RETRIEVER_FETCH_K = int(os.getenv("RETRIEVER_FETCH_K", "20"))
+CHAT_HISTORY_TOKEN_LIMIT = int(os.getenv("CHAT_HISTORY_TOKEN_LIMIT", "1500"))
+CHAT_SUMMARY_TOKEN_LIMIT = int(os.getenv("CHAT_SUMMARY_TOKEN_LIMIT", "400"))
+LLM_CONCURRENCY = int(os.getenv("LLM_CONCURRENCY", "4"))
+MAX_QUEUE_DEPTH = int(os.getenv("MAX_QUEUE_DEPTH", "32"))
+MAX_QUEUE_WAIT = float(os.getenv("MAX_QUEUE_WAIT", "20"))
+MAX_INDEXING_SLOTS = int(os.getenv("MAX_INDEXING_SLOTS", "1"))
+CHAT_BURST = float(os.getenv("CHAT_BURST", "5"))
+CHAT_RATE_PER_MINUTE = float(os.getenv("CHAT_RATE_PER_MINUTE", "20"))
+INDEXING_BURST = float(os.getenv("INDEXING_BURST", "1"))
+INDEXING_RATE_PER_MINUTE = float(os.getenv("INDEXING_RATE_PER_MINUTE", "2"))
 
 if not GOOGLE_API_KEY:
     raise ValueError("Google API key not found")
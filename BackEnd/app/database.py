@@ -46,4 +46,22 @@ def create_chat_history_table():
         """)
     conn.commit()
     conn.close()
-    print(f"[__name__] Chat history table ensured in {database_path}")
\ No newline at end of file
+    print(f"[__name__] Chat history table ensured in {database_path}")
+
+def create_chat_summary_table():
+    """
+    Creates a table "chat_summary" in Users database
+    Holds the rolling summary of each chat session and how many of its messages it covers
+    """
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute("DROP TABLE IF EXISTS chat_summary")
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS chat_summary(
+            session_id TEXT PRIMARY KEY,
+            summary TEXT NOT NULL,
+            summarized_count INTEGER NOT NULL)
+        """)
+    conn.commit()
+    conn.close()
+    print(f"[{__name__}] Chat summary table ensured in {database_path}")
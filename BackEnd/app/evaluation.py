@@ -0,0 +1,242 @@
+# Offline evaluation of the chunking and retrieval settings
+# Sweeps the settings over a golden question set and reports quality, prompt size and latency for each configuration
+#
+# Run from the BackEnd directory:
+#   python -m app.evaluation --chunk-sizes 1000 2000 --chunk-overlaps 200 400 --ks 4 10 --search-types mmr similarity
+
+# Importing necessary libraries
+import argparse
+import glob
+import itertools
+import json
+import os
+import shutil
+import time
+import tiktoken
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+from langchain.embeddings import CacheBackedEmbeddings
+from langchain.storage import LocalFileStore
+from langchain_google_genai import GoogleGenerativeAIEmbeddings
+from .chatbot import Indexing, build_retriever
+from .config import GOOGLE_API_KEY, DEFAULT_EMBEDDING_MODEL, CHUNK_SIZE, CHUNK_OVERLAP, RETRIEVER_SEARCH_TYPE, RETRIEVER_K, RETRIEVER_FETCH_K
+
+encoding = tiktoken.get_encoding("cl100k_base")
+
+DEFAULT_GOLDEN_SET = "./app/golden_questions.json"
+DEFAULT_WORK_DIR = "./evaluation"
+
+def percentile(values: List[float], p: float) -> float:
+    """
+    Returns the p-th percentile (0 to 1) of the values using the nearest-rank method
+    """
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(p * len(ordered)))]
+
+def load_golden_set(path: str) -> List[Dict]:
+    """
+    Loads the golden questions, each with the list of sources that can answer it
+    """
+    with open(path) as f:
+        questions = json.load(f)["questions"]
+    if not questions:
+        raise ValueError(f"No questions found in {path}")
+    return questions
+
+def build_indexes(docs, chunk_settings, embeddings, work_dir: str, workers: int) -> Dict:
+    """
+    Builds one vector store per (chunk_size, chunk_overlap) pair, in parallel
+    Chunks shared between settings are embedded once thanks to the embedding cache
+    Returns a dictionary mapping each pair to its vector store
+    """
+    def build(setting):
+        chunk_size, chunk_overlap = setting
+        persist_dir = os.path.join(work_dir, f"index_{chunk_size}_{chunk_overlap}")
+        shutil.rmtree(persist_dir, ignore_errors=True)
+        indexing = Indexing(
+            urls=[],
+            persist_dir=persist_dir,
+            embeddingmodel=DEFAULT_EMBEDDING_MODEL,
+            api_key=GOOGLE_API_KEY,
+            chunk_size=chunk_size,
+            chunk_overlap=chunk_overlap,
+            embedding_model_instance=embeddings
+        )
+        splits = indexing.document_splitter(docs)
+        print(f"[{__name__}] chunk_size={chunk_size} chunk_overlap={chunk_overlap}: {len(splits)} chunks")
+        indexing.embed_and_store(splits)
+        return setting, indexing.vector_store
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return dict(executor.map(build, chunk_settings))
+
+def measure_query_embedding(embedding_model, questions: List[Dict]) -> List[float]:
+    """
+    Times one uncached query-embedding call per golden question
+    This cost is the same for every configuration, so it is measured once and added to each configuration's search time
+    Returns the latency of each call in seconds
+    """
+    latencies = []
+    for item in questions:
+        started_at = time.perf_counter()
+        embedding_model.embed_query(item["question"])
+        latencies.append(time.perf_counter() - started_at)
+    return latencies
+
+def evaluate_retriever(retriever, questions: List[Dict], embedding_latencies: List[float]) -> Dict:
+    """
+    Runs every golden question through the retriever
+    recall@k is the share of questions with at least one expected source among the retrieved chunks.
+    Prompt tokens count the question plus the retrieved context that would be stuffed into the QA prompt.
+    Search latency is measured after a warm-up pass, so query embeddings come from the cache and only the vector
+    search is timed. End-to-end latency adds the uncached query-embedding time measured for the same question,
+    which is what /chat pays.
+    """
+    for item in questions:
+        retriever.invoke(item["question"])
+
+    hits, prompt_tokens, search_latencies = [], [], []
+    for item in questions:
+        started_at = time.perf_counter()
+        docs = retriever.invoke(item["question"])
+        search_latencies.append(time.perf_counter() - started_at)
+
+        retrieved = {doc.metadata.get("source") for doc in docs}
+        hits.append(bool(retrieved & set(item["sources"])))
+        prompt_tokens.append(
+            len(encoding.encode(item["question"])) + sum(len(encoding.encode(doc.page_content)) for doc in docs)
+        )
+    end_to_end_latencies = [search + embed for search, embed in zip(search_latencies, embedding_latencies)]
+
+    return {
+        "recall_at_k": sum(hits) / len(hits),
+        "mean_prompt_tokens": sum(prompt_tokens) / len(prompt_tokens),
+        "p50_search_latency_ms": percentile(search_latencies, 0.5) * 1000,
+        "p95_search_latency_ms": percentile(search_latencies, 0.95) * 1000,
+        "p50_end_to_end_latency_ms": percentile(end_to_end_latencies, 0.5) * 1000,
+        "p95_end_to_end_latency_ms": percentile(end_to_end_latencies, 0.95) * 1000
+    }
+
+def retrieval_settings(search_types: List[str], ks: List[int], fetch_ks: List[int]):
+    """
+    Yields the (search_type, k, fetch_k) combinations worth evaluating
+    fetch_k only matters for MMR, where it must be at least k
+    """
+    for search_type, k in itertools.product(search_types, ks):
+        if search_type == "mmr":
+            for fetch_k in fetch_ks:
+                if fetch_k >= k:
+                    yield search_type, k, fetch_k
+        else:
+            yield search_type, k, None
+
+def recommend(results: List[Dict], tolerance: float) -> Dict:
+    """
+    Picks the configuration with the fewest prompt tokens among those whose recall is within
+    `tolerance` of the best recall, breaking ties on p95 end-to-end latency
+    """
+    best_recall = max(result["recall_at_k"] for result in results)
+    candidates = [result for result in results if result["recall_at_k"] >= best_recall - tolerance]
+    return min(candidates, key=lambda result: (result["mean_prompt_tokens"], result["p95_end_to_end_latency_ms"]))
+
+def print_report(results: List[Dict], recommended: Dict):
+    """
+    Prints the results as a table, sorted by recall and then by prompt size
+    "search" latencies time the vector search alone, "e2e" latencies include the query-embedding call
+    """
+    header = (
+        f"{'chunk':>6} {'overlap':>7} {'search':>10} {'k':>3} {'fetch_k':>7} {'recall@k':>8} {'tokens':>7} "
+        f"{'search p50 ms':>13} {'search p95 ms':>13} {'e2e p50 ms':>10} {'e2e p95 ms':>10}"
+    )
+    print(header)
+    print("-" * len(header))
+    for result in sorted(results, key=lambda result: (-result["recall_at_k"], result["mean_prompt_tokens"])):
+        marker = "  <- recommended" if result is recommended else ""
+        print(
+            f"{result['chunk_size']:>6} {result['chunk_overlap']:>7} {result['search_type']:>10} {result['k']:>3} "
+            f"{result['fetch_k'] or '-':>7} {result['recall_at_k']:>8.2f} {result['mean_prompt_tokens']:>7.0f} "
+            f"{result['p50_search_latency_ms']:>13.1f} {result['p95_search_latency_ms']:>13.1f} "
+            f"{result['p50_end_to_end_latency_ms']:>10.1f} {result['p95_end_to_end_latency_ms']:>10.1f}{marker}"
+        )
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Sweep chunking and retrieval settings over a golden question set")
+    parser.add_argument("--golden-set", default=DEFAULT_GOLDEN_SET, help="JSON file with the golden questions and their expected sources")
+    parser.add_argument("--documents", nargs="+", default=None, help="Documents to index (defaults to everything in app/Data)")
+    parser.add_argument("--chunk-sizes", nargs="+", type=int, default=[CHUNK_SIZE])
+    parser.add_argument("--chunk-overlaps", nargs="+", type=int, default=[CHUNK_OVERLAP])
+    parser.add_argument("--search-types", nargs="+", choices=["mmr", "similarity"], default=[RETRIEVER_SEARCH_TYPE])
+    parser.add_argument("--ks", nargs="+", type=int, default=[RETRIEVER_K])
+    parser.add_argument("--fetch-ks", nargs="+", type=int, default=[RETRIEVER_FETCH_K])
+    parser.add_argument("--work-dir", default=DEFAULT_WORK_DIR, help="Where the indexes and the embedding cache are kept")
+    parser.add_argument("--workers", type=int, default=4, help="Number of indexes built in parallel")
+    parser.add_argument("--tolerance", type=float, default=0.0, help="Recall the recommended configuration may give up against the best one")
+    parser.add_argument("--output", default=None, help="Optional path to write the results as JSON")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    questions = load_golden_set(args.golden_set)
+    documents = args.documents or sorted(
+        path.replace(os.sep, "/") for pattern in ("*.md", "*.pdf") for path in glob.glob(os.path.join(".", "app", "Data", pattern))
+    )
+    chunk_settings = [
+        (chunk_size, chunk_overlap)
+        for chunk_size, chunk_overlap in itertools.product(args.chunk_sizes, args.chunk_overlaps)
+        if chunk_overlap < chunk_size
+    ]
+    if not chunk_settings:
+        raise ValueError("Every chunk overlap is at least as large as its chunk size")
+    search_settings = list(retrieval_settings(args.search_types, args.ks, args.fetch_ks))
+    if not search_settings:
+        raise ValueError("No retrieval settings left to evaluate: for mmr every fetch_k is smaller than its k")
+
+    os.makedirs(args.work_dir, exist_ok=True)
+    embedding_model = GoogleGenerativeAIEmbeddings(model=DEFAULT_EMBEDDING_MODEL, google_api_key=GOOGLE_API_KEY)
+    embeddings = CacheBackedEmbeddings.from_bytes_store(
+        embedding_model,
+        LocalFileStore(os.path.join(args.work_dir, "embedding_cache")),
+        namespace=DEFAULT_EMBEDDING_MODEL,
+        query_embedding_cache=True
+    )
+
+    print(f"[{__name__}] Loading {len(documents)} documents...")
+    # Documents are loaded once and shared by every index; this loader's own vector store stays in memory
+    docs = Indexing(
+        urls=documents,
+        persist_dir=None,
+        embeddingmodel=DEFAULT_EMBEDDING_MODEL,
+        api_key=GOOGLE_API_KEY,
+        embedding_model_instance=embeddings
+    ).load_documents()
+
+    print(f"[{__name__}] Building {len(chunk_settings)} indexes with {args.workers} workers...")
+    vector_stores = build_indexes(docs, chunk_settings, embeddings, args.work_dir, args.workers)
+
+    print(f"[{__name__}] Timing query embeddings for {len(questions)} questions...")
+    embedding_latencies = measure_query_embedding(embedding_model, questions)
+
+    results = []
+    for (chunk_size, chunk_overlap), vector_store in vector_stores.items():
+        for search_type, k, fetch_k in search_settings:
+            retriever = build_retriever(vector_store, search_type=search_type, k=k, fetch_k=fetch_k)
+            result = {
+                "chunk_size": chunk_size,
+                "chunk_overlap": chunk_overlap,
+                "search_type": search_type,
+                "k": k,
+                "fetch_k": fetch_k
+            }
+            result.update(evaluate_retriever(retriever, questions, embedding_latencies))
+            results.append(result)
+
+    recommended = recommend(results, args.tolerance)
+    print_report(results, recommended)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"results": results, "recommended": recommended}, f, indent=2)
+        print(f"[{__name__}] Results written to {args.output}")
+
+if __name__ == "__main__":
+    main()
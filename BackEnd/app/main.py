@@ -6,11 +6,13 @@ import os
 from fastapi import FastAPI
 from contextlib import asynccontextmanager
 from .routes import router
+from .chatbot import build_retriever
 from langchain_google_genai import GoogleGenerativeAIEmbeddings
 from langchain_chroma import Chroma
-from .config import GOOGLE_API_KEY, PERSIST_DIRECTORY, DEFAULT_EMBEDDING_MODEL
+from .config import GOOGLE_API_KEY, PERSIST_DIRECTORY, DEFAULT_EMBEDDING_MODEL, LLM_CONCURRENCY, MAX_QUEUE_DEPTH, MAX_QUEUE_WAIT, MAX_INDEXING_SLOTS, CHAT_BURST, CHAT_RATE_PER_MINUTE, INDEXING_BURST, INDEXING_RATE_PER_MINUTE
 from fastapi.middleware.cors import CORSMiddleware
-from .database import create_user_table, create_chat_history_table
+from .database import create_user_table, create_chat_history_table, create_chat_summary_table
+from .scheduler import FairScheduler, PRIORITY_CHAT, PRIORITY_INDEXING, PRIORITY_SUMMARY
 from starlette.middleware.sessions import SessionMiddleware
 import secrets
 
@@ -28,6 +30,10 @@ async def lifespan(app: FastAPI):
     create_chat_history_table()
     print(f"[__name__] Chat history table ready")
 
+    print(f"[{__name__}] Ensuring that chat summary table exists")
+    create_chat_summary_table()
+    print(f"[{__name__}] Chat summary table ready")
+
     print(f"[{__name__}] Application starting up..")
     print(f"[app.main] Checking for persist directory: {PERSIST_DIRECTORY}")
     
@@ -44,15 +50,29 @@ async def lifespan(app: FastAPI):
             persist_directory = PERSIST_DIRECTORY,
             embedding_function = embedding_model
         )
-        retriever_instance = vector_stores.as_retriever(
-            search_type = "mmr",
-            search_kwargs = {"k":10}
-        )
+        retriever_instance = build_retriever(vector_stores)
         app.state.retriever_instance = retriever_instance
         print(f"[{__name__}] RAG pipeline initialised and retriever instance saved in app.state")
     except Exception as e:
         print(f"[{__name__}] CRITICAL ERROR during RAG pipeline initialisation: {e}") 
         raise 
+
+    app.state.scheduler = FairScheduler(
+        concurrency = LLM_CONCURRENCY,
+        max_queue_depth = MAX_QUEUE_DEPTH,
+        max_queue_wait = MAX_QUEUE_WAIT,
+        rate_limits = {
+            PRIORITY_CHAT: (CHAT_BURST, CHAT_RATE_PER_MINUTE),
+            PRIORITY_INDEXING: (INDEXING_BURST, INDEXING_RATE_PER_MINUTE),
+            # At most one summary update follows each chat turn
+            PRIORITY_SUMMARY: (CHAT_BURST, CHAT_RATE_PER_MINUTE)
+        },
+        # Indexing never gets every slot, so chat always has at least one left
+        slot_limits = {
+            PRIORITY_INDEXING: min(MAX_INDEXING_SLOTS, max(1, LLM_CONCURRENCY - 1))
+        }
+    )
+    print(f"[{__name__}] Scheduler initialised with {LLM_CONCURRENCY} LLM slots")
     
     yield
 
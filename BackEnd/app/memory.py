@@ -0,0 +1,226 @@
+# Token-budgeted conversational memory
+# Keeps the latest turns of a session verbatim and folds older turns into a rolling summary
+
+# Importing necessary libraries
+from typing import Any, Dict, List, Optional, Tuple
+import tiktoken
+from langchain_core.chat_history import BaseChatMessageHistory
+from langchain_core.language_models import BaseChatModel
+from langchain_core.memory import BaseMemory
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage
+from langchain.prompts import ChatPromptTemplate
+from .database import get_db_connection
+
+summary_prompt = ChatPromptTemplate.from_messages(
+    [("system", """Progressively summarize the conversation between a student and the IIITB Freshers assistant. \
+    Rewrite the current summary so that it also covers the new lines of conversation and return only the updated summary. \
+    Keep names, programmes, courses, numbers and any open questions; drop pleasantries and older details first. \
+    The summary must stay under {max_words} words."""),
+     ("human", "Current summary:\n{summary}\n\nNew lines of conversation:\n{new_lines}")
+    ]
+)
+
+encoding = tiktoken.get_encoding("cl100k_base")
+
+def count_tokens(messages: List[BaseMessage]) -> int:
+    """
+    Estimates the number of prompt tokens taken up by a list of messages
+    """
+    return sum(len(encoding.encode(str(message.content))) for message in messages)
+
+def truncate_tokens(text: str, limit: int) -> str:
+    """
+    Cuts a text down to about `limit` tokens, marking the cut with an ellipsis
+    """
+    tokens = encoding.encode(text)
+    if len(tokens) <= limit:
+        return text
+    return encoding.decode(tokens[:max(limit - 1, 0)]) + " ..."
+
+def split_turns(messages: List[BaseMessage]) -> List[List[BaseMessage]]:
+    """
+    Groups messages into turns, each starting with a human message followed by the answers to it
+    """
+    turns: List[List[BaseMessage]] = []
+    for message in messages:
+        if isinstance(message, HumanMessage) or not turns:
+            turns.append([message])
+        else:
+            turns[-1].append(message)
+    return turns
+
+def fit_turn(turn: List[BaseMessage], budget: int) -> List[BaseMessage]:
+    """
+    Truncates the messages of a turn if it does not fit in `budget` tokens
+    Short messages are kept whole and whatever they leave over goes to the longer ones
+    """
+    if count_tokens(turn) <= budget:
+        return turn
+    sizes = [count_tokens([message]) for message in turn]
+    limits = [0] * len(turn)
+    remaining = budget
+    for position, index in enumerate(sorted(range(len(turn)), key=lambda i: sizes[i])):
+        limits[index] = min(sizes[index], max(1, remaining // (len(turn) - position)))
+        remaining -= limits[index]
+    return [
+        message if limit >= size else message.__class__(content=truncate_tokens(str(message.content), limit))
+        for message, size, limit in zip(turn, sizes, limits)
+    ]
+
+def load_summary(session_id: str) -> Tuple[str, int]:
+    """
+    Fetches the stored summary for a session
+    Returns the summary text and the number of messages already folded into it
+    """
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute("SELECT summary, summarized_count FROM chat_summary WHERE session_id = ?", (session_id,))
+    row = cursor.fetchone()
+    conn.close()
+    if not row:
+        return "", 0
+    return row["summary"], row["summarized_count"]
+
+def store_summary(session_id: str, summary: str, summarized_count: int):
+    """
+    Saves the summary of a session along with the number of messages it covers
+    """
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute(
+        "INSERT OR REPLACE INTO chat_summary (session_id, summary, summarized_count) VALUES (?, ?, ?)",
+        (session_id, summary, summarized_count)
+    )
+    conn.commit()
+    conn.close()
+
+class SummaryBufferMemory(BaseMemory):
+    """
+    The SummaryBufferMemory class serves the chat history of a session within a token budget. A summary of the older
+    turns, capped at `max_summary_tokens`, is followed by the most recent turns that fit in what is left of
+    `max_token_limit`; the newest turn is always kept, truncated if it does not fit on its own. The summary is stored
+    in the chat_summary table next to chat_history and is only brought up to date by `update_summary`, which is meant
+    to run after the response has been sent.
+    """
+    chat_memory: BaseChatMessageHistory
+    llm: BaseChatModel
+    session_id: str
+    max_token_limit: int = 1500
+    max_summary_tokens: int = 400
+    memory_key: str = "chat_history"
+
+    @property
+    def memory_variables(self) -> List[str]:
+        return [self.memory_key]
+
+    @staticmethod
+    def _summary_message(summary: str) -> AIMessage:
+        return AIMessage(content=f"Summary of our conversation so far: {summary}")
+
+    def _split_history(self) -> Tuple[str, int, List[List[BaseMessage]], List[List[BaseMessage]], int]:
+        """
+        Splits the unsummarized turns of the session into those that overflow the token budget and the recent ones
+        that fit in it once the summary has been paid for. The newest turn is always recent, truncated if need be.
+        Returns the stored summary, the number of messages it covers, the overflowing turns, the recent turns as they
+        should be shown and the budget left over
+        """
+        summary, summarized_count = load_summary(self.session_id)
+        turns = split_turns(self.chat_memory.messages[summarized_count:])
+
+        budget = self.max_token_limit
+        if summary:
+            budget -= count_tokens([self._summary_message(summary)])
+        recent: List[List[BaseMessage]] = []
+        split = len(turns)
+        while split > 0:
+            turn = turns[split - 1] if recent else fit_turn(turns[split - 1], budget)
+            cost = count_tokens(turn)
+            if recent and cost > budget:
+                break
+            recent.insert(0, turn)
+            budget -= cost
+            split -= 1
+        return summary, summarized_count, turns[:split], recent, budget
+
+    def _context_message(self, summary: str, pending: List[List[BaseMessage]], budget: int) -> Optional[AIMessage]:
+        """
+        Builds the message that stands in for everything older than the recent turns: the summary, plus the
+        questions of overflowing turns it does not cover yet, squeezed into whatever budget is left
+        """
+        parts = []
+        if summary:
+            parts.append(self._summary_message(summary).content)
+        if pending and budget >= 16:
+            questions = "; ".join(str(turn[0].content) for turn in pending)
+            parts.append(truncate_tokens(f"Earlier questions not covered by the summary yet: {questions}", budget))
+        if not parts:
+            return None
+        return AIMessage(content="\n".join(parts))
+
+    def load_memory_variables(self, inputs: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Returns the summary of the older turns followed by the recent turns, all within `max_token_limit`
+        Overflowing turns that `update_summary` has not folded in yet, e.g. because it was rejected or failed, are
+        collapsed to their questions in the space left over and dropped beyond that, so the history never grows
+        past the budget
+        """
+        summary, _, pending, recent, budget = self._split_history()
+        history: List[BaseMessage] = []
+        context = self._context_message(summary, pending, budget)
+        if context:
+            history.append(context)
+        for turn in recent:
+            history.extend(turn)
+        return {self.memory_key: history}
+
+    def save_context(self, inputs: Dict[str, Any], outputs: Dict[str, str]) -> None:
+        """
+        Appends the latest exchange to the chat history without touching the summary
+        """
+        self.chat_memory.add_messages([
+            HumanMessage(content=inputs["input"]),
+            AIMessage(content=outputs["output"])
+        ])
+
+    def has_overflow(self) -> bool:
+        """
+        Returns True if some turns no longer fit in the token budget and are waiting to be summarized
+        """
+        return bool(self._split_history()[2])
+
+    def update_summary(self):
+        """
+        Folds the oldest turns that overflow the token budget into the stored summary, keeping it within `max_summary_tokens`
+        At most `max_token_limit` tokens of conversation are folded per call, so a backlog left by failed updates
+        is worked off over the following turns instead of producing one oversized summarisation prompt
+        """
+        try:
+            summary, summarized_count, overflow_turns, _, _ = self._split_history()
+            if not overflow_turns:
+                return
+            piece: List[BaseMessage] = []
+            piece_tokens = 0
+            for turn in overflow_turns:
+                cost = count_tokens(turn)
+                if piece and piece_tokens + cost > self.max_token_limit:
+                    break
+                piece.extend(turn)
+                piece_tokens += cost
+            new_lines = truncate_tokens("\n".join(
+                f"{'Student' if isinstance(message, HumanMessage) else 'Assistant'}: {message.content}"
+                for message in piece
+            ), self.max_token_limit)
+            response = self.llm.invoke(summary_prompt.format_messages(
+                summary=summary or "(none)",
+                new_lines=new_lines,
+                max_words=self.max_summary_tokens * 3 // 4
+            ))
+            new_summary = truncate_tokens(str(response.content), self.max_summary_tokens)
+            store_summary(self.session_id, new_summary, summarized_count + len(piece))
+            print(f"[{__name__}] Folded {len(piece)} messages into the summary of session {self.session_id}")
+        except Exception as e:
+            print(f"[{__name__}] Failed to update the summary of session {self.session_id}: {e}")
+
+    def clear(self) -> None:
+        self.chat_memory.clear()
+        store_summary(self.session_id, "", 0)
@@ -2,25 +2,41 @@
 
 #Importing the necessary modules
 import os
-from fastapi import APIRouter, HTTPException, Request, Depends, status
+from fastapi import APIRouter, HTTPException, Request, Depends, status, BackgroundTasks
 from pydantic import BaseModel
 from typing import List, Dict, Optional
 from .chatbot import Indexing, Generation
-from .config import GOOGLE_API_KEY, PERSIST_DIRECTORY, DEFAULT_EMBEDDING_MODEL, DEFAULT_LLM_MODEL
+from .config import GOOGLE_API_KEY, PERSIST_DIRECTORY, DEFAULT_EMBEDDING_MODEL, DEFAULT_LLM_MODEL, CHAT_HISTORY_TOKEN_LIMIT, CHAT_SUMMARY_TOKEN_LIMIT
 from .database import get_db_connection  
 from .security import hash_password, verify_password
 from .auth import create_access_token, get_current_user
 from datetime import timedelta
 import uuid
 from langchain_community.chat_message_histories import SQLChatMessageHistory
-from langchain.memory import ConversationBufferWindowMemory
+from langchain_google_genai import ChatGoogleGenerativeAI
+from .memory import SummaryBufferMemory
 from sqlalchemy import create_engine
 from fastapi.responses import RedirectResponse
 from starlette.requests import Request as StarletteRequest
 from .google_oauth import oauth
+from .scheduler import PRIORITY_CHAT, PRIORITY_INDEXING, PRIORITY_SUMMARY
+from starlette.concurrency import run_in_threadpool
 
 router = APIRouter()
 
+async def summarize_session(scheduler, username: str, memory: SummaryBufferMemory):
+    """
+    Folds overflowing turns into the session summary once the chat response has been sent
+    The summarisation call takes a low-priority scheduler slot, so it counts against the user's limits like any other LLM call
+    """
+    if not await run_in_threadpool(memory.has_overflow):
+        return
+    try:
+        async with scheduler.slot(username, PRIORITY_SUMMARY):
+            await run_in_threadpool(memory.update_summary)
+    except HTTPException as e:
+        print(f"[{__name__}] Summary update for {username} skipped: {e.detail}")
+
 class IndexRequest(BaseModel):
     """
     Schema for the request body when indexing documents
@@ -78,31 +94,33 @@ async def index_docs(request: Request, index_request_data: IndexRequest, current
         raise HTTPException(status_code=400, detail="No URL(s) provided for indexing")
     print(f"[{__name__}] Received indexing requests for URLs: {index_request_data.urls}")
 
-    try:
-        indexing = Indexing(
-            urls=index_request_data.urls,
-            persist_dir=PERSIST_DIRECTORY,
-            embeddingmodel=DEFAULT_EMBEDDING_MODEL,
-            api_key=GOOGLE_API_KEY
-        )
-        new_retriever_instance = indexing.build_indexing()
-        request.app.state.retriever_instance = new_retriever_instance
-        print(f"[{__name__}] Indexing complete and retriever updated successfully in app.state.")
-        return {"message": "Documents indexed successfully and retriever updated."}
-    except ValueError as ve:
-        raise HTTPException(status_code=400, detail=f"Indexing failed due to invalid input: {str(ve)}")
-    except RuntimeError as re:
-        raise HTTPException(status_code=500, detail=f"Indexing process encountered a runtime error: {str(re)}")
-    except Exception as e:
-        print(f"[{__name__}] ERROR during indexing: {e}")
-        raise HTTPException(status_code=500, detail=f"An unexpected error occurred during indexing: {str(e)}")
-    
+    async with request.app.state.scheduler.slot(current_user, PRIORITY_INDEXING):
+        try:
+            indexing = Indexing(
+                urls=index_request_data.urls,
+                persist_dir=PERSIST_DIRECTORY,
+                embeddingmodel=DEFAULT_EMBEDDING_MODEL,
+                api_key=GOOGLE_API_KEY
+            )
+            new_retriever_instance = await run_in_threadpool(indexing.build_indexing)
+            request.app.state.retriever_instance = new_retriever_instance
+            print(f"[{__name__}] Indexing complete and retriever updated successfully in app.state.")
+            return {"message": "Documents indexed successfully and retriever updated."}
+        except ValueError as ve:
+            raise HTTPException(status_code=400, detail=f"Indexing failed due to invalid input: {str(ve)}")
+        except RuntimeError as re:
+            raise HTTPException(status_code=500, detail=f"Indexing process encountered a runtime error: {str(re)}")
+        except Exception as e:
+            print(f"[{__name__}] ERROR during indexing: {e}")
+            raise HTTPException(status_code=500, detail=f"An unexpected error occurred during indexing: {str(e)}")
+
 @router.post("/chat", response_model=ChatResponse)
-async def chat_with_bot(request: Request, chat_request_data: ChatRequest, current_user_username: str = Depends(get_current_user)):
+async def chat_with_bot(request: Request, chat_request_data: ChatRequest, background_tasks: BackgroundTasks, current_user_username: str = Depends(get_current_user)):
     """
     This is the endpoint for chatting with the bot
     Expects a single user query
     Returns an answer(str) and list of sources
+    The session summary is brought up to date in the background once the response has been sent
     """
     print(f"[{__name__}] Chat request received with body: {chat_request_data}")
     print(f"[{__name__}] Authenticated user from dependency: {current_user_username}")
@@ -143,29 +161,40 @@ async def chat_with_bot(request: Request, chat_request_data: ChatRequest, curren
         session_id_field_name="session_id"
     )
 
-    conversational_memory = ConversationBufferWindowMemory(
-        k=5,
+    conversational_memory = SummaryBufferMemory(
         chat_memory=message_history,
-        memory_key="chat_history",
-        return_messages=True
+        llm=ChatGoogleGenerativeAI(model=DEFAULT_LLM_MODEL, temperature=0, google_api_key=GOOGLE_API_KEY),
+        session_id=f"{user_id}_{session_id}",
+        max_token_limit=CHAT_HISTORY_TOKEN_LIMIT,
+        max_summary_tokens=CHAT_SUMMARY_TOKEN_LIMIT,
+        memory_key="chat_history"
     )
 
-    try:
-        generator = Generation(
-            query = user_query,
-            api_key = GOOGLE_API_KEY,
-            retriever = retriever_instance, 
-            model = DEFAULT_LLM_MODEL,
-            memory=conversational_memory
-        )
-        answer, sources = generator.generate()
-        print(f"[{__name__}] Generated answer: {answer}")
-        print(f"[{__name__}] Sources: {list(sources)}")
-        return ChatResponse(answer = answer, sources = list(sources), session_id = session_id)
-    except Exception as e:
-        print(f"[{__name__}] An error occurred: {e}")
-        raise HTTPException(status_code=500, detail="An error occurred")
-    
+    async with request.app.state.scheduler.slot(current_user_username, PRIORITY_CHAT):
+        try:
+            generator = Generation(
+                query = user_query,
+                api_key = GOOGLE_API_KEY,
+                retriever = retriever_instance, 
+                model = DEFAULT_LLM_MODEL,
+                memory=conversational_memory
+            )
+            answer, sources = await run_in_threadpool(generator.generate)
+            print(f"[{__name__}] Generated answer: {answer}")
+            print(f"[{__name__}] Sources: {list(sources)}")
+            background_tasks.add_task(summarize_session, request.app.state.scheduler, current_user_username, conversational_memory)
+            return ChatResponse(answer = answer, sources = list(sources), session_id = session_id)
+        except Exception as e:
+            print(f"[{__name__}] An error occurred: {e}")
+            raise HTTPException(status_code=500, detail="An error occurred")
+
+@router.get("/metrics")
+async def scheduler_metrics(request: Request):
+    """
+    Reports the scheduler's slot usage, queue depth, wait times and rejections
+    """
+    return request.app.state.scheduler.metrics()
+
 @router.post("/signup", response_model=Dict[str, str])
 async def signup(user: UserCreate):
     """
@@ -0,0 +1,278 @@
+# Admission control for the expensive endpoints
+# Rate limits every user with a token bucket and shares the limited LLM slots fairly between users
+
+# Importing necessary libraries
+import asyncio
+import math
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import Deque, Dict, Optional, Tuple
+from fastapi import HTTPException, status
+
+PRIORITY_CHAT = "chat"
+PRIORITY_INDEXING = "indexing"
+PRIORITY_SUMMARY = "summary"
+
+# Classes are served in this order whenever a slot frees up
+PRIORITY_ORDER = (PRIORITY_CHAT, PRIORITY_INDEXING, PRIORITY_SUMMARY)
+
+class TokenBucket:
+    """
+    A token bucket holding at most `capacity` tokens, refilled at `refill_rate` tokens per second.
+    Every admitted request consumes one token.
+    """
+    def __init__(self, capacity: float, refill_rate: float):
+        self.capacity = capacity
+        self.refill_rate = refill_rate
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def refill(self):
+        """
+        Adds the tokens earned since the last update
+        """
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.refill_rate)
+        self.updated = now
+
+    def is_full(self) -> bool:
+        """
+        Returns True if the bucket has refilled to capacity, i.e. it holds no state worth keeping
+        """
+        self.refill()
+        return self.tokens >= self.capacity
+
+    def try_consume(self) -> Tuple[bool, float]:
+        """
+        Takes a token from the bucket if one is available
+        Returns whether the token was taken and, if not, the seconds until one will be
+        """
+        self.refill()
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True, 0.0
+        return False, (1 - self.tokens) / self.refill_rate
+
+    def refund(self):
+        """
+        Gives back a token taken by a request that was rejected without being served
+        """
+        self.refill()
+        self.tokens = min(self.capacity, self.tokens + 1)
+
+class FairScheduler:
+    """
+    The FairScheduler limits how many chat, indexing and background summary jobs may use the LLM/embedding backends at once.
+    Requests over a user's rate limit are rejected straight away. Requests that find every slot busy wait in a
+    per-user queue; waiting users are served round-robin so one user cannot crowd out the others, and chat is
+    always served before indexing, which comes before summaries. Classes listed in `slot_limits` may only hold that many
+    slots at once, so long indexing runs cannot take every slot away from chat. When the queue is full, or a request
+    waits too long, it is rejected with 429 and its rate-limit token is given back.
+    """
+    def __init__(self, concurrency: int, max_queue_depth: int, max_queue_wait: float, rate_limits: Dict[str, Tuple[float, float]], slot_limits: Optional[Dict[str, int]] = None):
+        """
+        Initializes the FairScheduler class.
+
+        Args:
+            concurrency (int): Number of requests allowed to run at the same time.
+            max_queue_depth (int): Number of requests allowed to wait for a slot, across all users.
+            max_queue_wait (float): Seconds a request may wait for a slot before it is rejected.
+            rate_limits (dict): Maps each priority class to a (burst, requests per minute) pair.
+            slot_limits (dict): Maps a priority class to the most slots it may hold at once; classes left out may use every slot.
+        """
+        self.concurrency = concurrency
+        self.max_queue_depth = max_queue_depth
+        self.max_queue_wait = max_queue_wait
+        self.rate_limits = rate_limits
+        self.slot_limits = slot_limits or {}
+        self.in_flight = 0
+        self.in_flight_by_class = {priority: 0 for priority in PRIORITY_ORDER}
+        self.buckets: Dict[Tuple[str, str], TokenBucket] = {}
+        self.last_sweep = time.monotonic()
+        self.queues: Dict[str, "OrderedDict[str, Deque[asyncio.Future]]"] = {
+            priority: OrderedDict() for priority in PRIORITY_ORDER
+        }
+        self.queue_depth = {priority: 0 for priority in PRIORITY_ORDER}
+        self.admitted = {priority: 0 for priority in PRIORITY_ORDER}
+        self.rejected = {"rate_limited": 0, "queue_full": 0, "queue_timeout": 0}
+        self.wait_times: Deque[float] = deque(maxlen=1000)
+        self.avg_service_time = 1.0
+
+    def _reject(self, reason: str, retry_after: float, detail: str):
+        """
+        Records a rejection and raises a 429 carrying a Retry-After header
+        """
+        self.rejected[reason] += 1
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail=detail,
+            headers={"Retry-After": str(max(1, math.ceil(retry_after)))}
+        )
+
+    def _sweep_buckets(self):
+        """
+        Drops the buckets that have refilled to capacity, at most once a minute
+        A dropped bucket is recreated full on the user's next request, so nothing is lost
+        """
+        now = time.monotonic()
+        if now - self.last_sweep < 60:
+            return
+        self.last_sweep = now
+        for key in [key for key, bucket in self.buckets.items() if bucket.is_full()]:
+            del self.buckets[key]
+
+    def _check_rate_limit(self, user: str, priority: str) -> TokenBucket:
+        """
+        Consumes a token from the user's bucket for this priority class, rejecting the request if it is empty
+        Returns the bucket, so the token can be refunded if the request is rejected later on
+        """
+        self._sweep_buckets()
+        bucket = self.buckets.get((user, priority))
+        if bucket is None:
+            burst, per_minute = self.rate_limits[priority]
+            bucket = TokenBucket(capacity=burst, refill_rate=per_minute / 60)
+            self.buckets[(user, priority)] = bucket
+        allowed, retry_after = bucket.try_consume()
+        if not allowed:
+            print(f"[{__name__}] Rate limit exceeded for {user} ({priority})")
+            self._reject("rate_limited", retry_after, f"Too many {priority} requests, please slow down")
+        return bucket
+
+    def _estimated_wait(self) -> float:
+        """
+        Estimates how long a new request would wait for a slot given the current backlog
+        """
+        waiting = sum(self.queue_depth.values())
+        return (waiting + 1) * self.avg_service_time / self.concurrency
+
+    def _remove_waiter(self, user: str, priority: str, waiter: asyncio.Future):
+        """
+        Takes a waiter that gave up out of its user's queue
+        """
+        user_queue = self.queues[priority].get(user)
+        if user_queue and waiter in user_queue:
+            user_queue.remove(waiter)
+            self.queue_depth[priority] -= 1
+            if not user_queue:
+                del self.queues[priority][user]
+
+    def _can_start(self, priority: str) -> bool:
+        """
+        Returns True if a slot is free and the priority class is below its slot limit
+        """
+        if self.in_flight >= self.concurrency:
+            return False
+        return self.in_flight_by_class[priority] < self.slot_limits.get(priority, self.concurrency)
+
+    def _take_slot(self, priority: str):
+        self.in_flight += 1
+        self.in_flight_by_class[priority] += 1
+
+    def _dispatch(self):
+        """
+        Hands free slots to waiting requests, taking the highest priority class that is below its slot limit
+        first and rotating between users within a class
+        """
+        while self.in_flight < self.concurrency:
+            for priority in PRIORITY_ORDER:
+                if self.queues[priority] and self._can_start(priority):
+                    break
+            else:
+                return
+            user, user_queue = self.queues[priority].popitem(last=False)
+            waiter = user_queue.popleft()
+            self.queue_depth[priority] -= 1
+            if user_queue:
+                self.queues[priority][user] = user_queue
+            self._take_slot(priority)
+            waiter.set_result(None)
+
+    async def _acquire(self, user: str, priority: str):
+        """
+        Waits until a slot is handed to this request, rejecting it if the queue is full or the wait is too long
+        Every wait is recorded, including those that end in a timeout
+        """
+        # Slots are handed out as soon as they are released, so when one is free nobody who could use it is waiting
+        if self._can_start(priority):
+            self._take_slot(priority)
+            self.wait_times.append(0.0)
+            return
+        if sum(self.queue_depth.values()) >= self.max_queue_depth:
+            print(f"[{__name__}] Queue full, rejecting {priority} request from {user}")
+            self._reject("queue_full", self._estimated_wait(), "Server is busy, please try again shortly")
+
+        queued_at = time.monotonic()
+        waiter = asyncio.get_running_loop().create_future()
+        self.queues[priority].setdefault(user, deque()).append(waiter)
+        self.queue_depth[priority] += 1
+        try:
+            await asyncio.wait({waiter}, timeout=self.max_queue_wait)
+        except asyncio.CancelledError:
+            if waiter.done():
+                self._release(priority)
+            else:
+                self._remove_waiter(user, priority, waiter)
+            raise
+        self.wait_times.append(time.monotonic() - queued_at)
+        if not waiter.done():
+            self._remove_waiter(user, priority, waiter)
+            print(f"[{__name__}] {priority} request from {user} timed out waiting for a slot")
+            self._reject("queue_timeout", self._estimated_wait(), "Server is busy, please try again shortly")
+
+    def _release(self, priority: str):
+        """
+        Returns a slot and passes it on to the next waiting request
+        """
+        self.in_flight -= 1
+        self.in_flight_by_class[priority] -= 1
+        self._dispatch()
+
+    @asynccontextmanager
+    async def slot(self, user: str, priority: str):
+        """
+        Admits a request from `user` in the given priority class and holds an LLM slot for the duration of the block.
+        Raises a 429 HTTPException with a Retry-After header when the request is rate limited or the server is overloaded.
+        """
+        bucket = self._check_rate_limit(user, priority)
+        try:
+            await self._acquire(user, priority)
+        except HTTPException:
+            bucket.refund()
+            raise
+        started_at = time.monotonic()
+        self.admitted[priority] += 1
+        try:
+            yield
+        finally:
+            self.avg_service_time = 0.9 * self.avg_service_time + 0.1 * (time.monotonic() - started_at)
+            self._release(priority)
+
+    def metrics(self) -> Dict:
+        """
+        Returns a snapshot of slot usage, queue depth, wait times and rejection counts
+        Wait times cover admitted requests as well as those that timed out in the queue
+        """
+        waits = sorted(self.wait_times)
+
+        def percentile(p):
+            if not waits:
+                return 0.0
+            return waits[min(len(waits) - 1, int(p * len(waits)))]
+
+        return {
+            "concurrency": self.concurrency,
+            "in_flight": self.in_flight,
+            "in_flight_by_class": dict(self.in_flight_by_class),
+            "slot_limits": dict(self.slot_limits),
+            "queue_depth": dict(self.queue_depth),
+            "queued_users": {priority: len(queue) for priority, queue in self.queues.items()},
+            "admitted": dict(self.admitted),
+            "rate_limit_buckets": len(self.buckets),
+            "rejected": dict(self.rejected),
+            "wait_seconds": {
+                "p50": percentile(0.5),
+                "p95": percentile(0.95),
+                "max": waits[-1] if waits else 0.0
+            }
+        }